@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.schedules import crontab
 from settings import settings
 
 celery = Celery(
@@ -6,10 +7,24 @@ celery = Celery(
     broker=settings.celery_broker_url,
     backend=settings.celery_result_backend
 )
+celery.conf.beat_schedule = {
+    "maintain-note-storage": {
+        "task": "celery_app.maintain_note_storage",
+        "schedule": crontab(hour=3, minute=0),
+    },
+}
 #1
 
 @celery.task
 def send_mock_email(email: str):
     import time
     time.sleep(10)
-    print(f"Email sent to {email}") 
\ No newline at end of file
+    print(f"Email sent to {email}") 
+
+@celery.task
+def maintain_note_storage():
+    import asyncio
+    from notes.partitions import run_note_storage_maintenance
+    archived = asyncio.run(run_note_storage_maintenance())
+    print(f"Archived note periods: {archived or 'none'}")
+    return archived
@@ -9,6 +9,7 @@ from models import User
 from database import get_session, create_db_and_tables
 from settings import settings
 from notes.routes import router as notes_router
+from notes.partitions import ensure_note_partitions
 from auth.dependencies import get_current_user, oauth2_scheme
 from celery_app import send_mock_email
 from redis_cache import close_redis_client
@@ -24,12 +25,19 @@ pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
 @app.on_event("startup")
 async def on_startup():
     await create_db_and_tables()
+    await create_note_partitions()
     await create_default_admin()
 
 @app.on_event("shutdown")
 async def on_shutdown():
     await close_redis_client()
 
+async def create_note_partitions():
+    async for session in get_session():
+        await ensure_note_partitions(session)
+        await session.close()
+        break
+
 async def create_default_admin():
     async for session in get_session():
         admin = await session.execute(select(User).where(User.username == "admin"))
@@ -1,4 +1,6 @@
 from sqlmodel import SQLModel, Field, Relationship
+from sqlalchemy import PrimaryKeyConstraint
+from sqlalchemy.ext.compiler import compiles
 from typing import Optional, List, TYPE_CHECKING
 from datetime import datetime
 
@@ -6,8 +8,47 @@ if TYPE_CHECKING:
     from models import User
 
 class Note(SQLModel, table=True):
+    # On PostgreSQL the table is range-partitioned by month on created_at
+    # (see notes/partitions.py). SQLite must never reuse the id of a deleted
+    # (archived) note, or archive lookups by id would hit the wrong note.
+    __table_args__ = {
+        "postgresql_partition_by": "RANGE (created_at)",
+        "sqlite_autoincrement": True,
+    }
+
     id: Optional[int] = Field(default=None, primary_key=True)
     text: str
     created_at: datetime = Field(default_factory=datetime.utcnow)
     owner_id: int = Field(foreign_key="user.id")
-    owner: Optional["User"] = Relationship(back_populates="notes") 
\ No newline at end of file
+    owner: Optional["User"] = Relationship(back_populates="notes")
+
+class NoteArchive(SQLModel, table=True):
+    """Manifest entry for a month of notes moved to compressed archive storage"""
+    __tablename__ = "note_archive"
+
+    period: str = Field(primary_key=True)
+    path: str
+    block_index: str
+    min_id: int = Field(index=True)
+    max_id: int = Field(index=True)
+    note_count: int
+    archived_at: datetime = Field(default_factory=datetime.utcnow)
+
+class NoteArchiveRestored(SQLModel, table=True):
+    """Archived note brought back into the note table; its archive copy is stale"""
+    __tablename__ = "note_archive_restored"
+
+    period: str = Field(primary_key=True)
+    note_id: int = Field(primary_key=True)
+
+@compiles(PrimaryKeyConstraint, "postgresql")
+def compile_primary_key(constraint, compiler, **kw):
+    # A partitioned table needs the partition key in its primary key. The ORM
+    # keeps identifying notes by id alone, which the serial sequence keeps unique.
+    if constraint.table is Note.__table__:
+        columns = ", ".join(
+            compiler.preparer.format_column(column)
+            for column in (Note.__table__.c.id, Note.__table__.c.created_at)
+        )
+        return f"PRIMARY KEY ({columns})"
+    return compiler.visit_primary_key_constraint(constraint, **kw)
@@ -0,0 +1,395 @@
+import asyncio
+import gzip
+import json
+import os
+import re
+from bisect import bisect_right
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Set
+import redis.asyncio as redis
+from sqlalchemy import delete, func, text
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlmodel import select
+from notes.models import Note, NoteArchive, NoteArchiveRestored
+from database import AsyncSessionLocal, engine
+from redis_cache import CacheManager, REDIS_URL
+from settings import settings
+
+PARTITION_NAME = re.compile(r"^note_y(\d{4})m(\d{2})$")
+DEFAULT_PARTITION = "note_default"
+# Notes per independently compressed gzip member of an archive file
+ARCHIVE_BLOCK_SIZE = 256
+# Notes fetched per keyset page while archiving a month
+READ_BATCH_SIZE = 1000
+# Ids per DELETE statement, well under SQLite's bound parameter limit
+DELETE_BATCH_SIZE = 500
+
+def period_start(moment: datetime) -> datetime:
+    """First instant of the month containing moment"""
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+def shift_period(start: datetime, months: int) -> datetime:
+    """Move a period start by a number of months"""
+    index = start.year * 12 + start.month - 1 + months
+    return start.replace(year=index // 12, month=index % 12 + 1)
+
+def partition_name(start: datetime) -> str:
+    return f"note_y{start:%Y}m{start:%m}"
+
+def archive_path(start: datetime, archived_at: datetime) -> str:
+    # Every rewrite gets a new file, so the manifest only points at it once committed
+    filename = f"{partition_name(start)}-{archived_at:%Y%m%d%H%M%S%f}.ndjson.gz"
+    return os.path.join(settings.note_archive_dir, filename)
+
+class ArchiveWriter:
+    """Writes id-sorted notes as gzip NDJSON, one gzip member per block of notes.
+
+    The block index ([first_id, offset, length] per member) lets a reader
+    decompress only the block that can hold a given note.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self.blocks: List[List[int]] = []
+        self.pending: List[Dict[str, Any]] = []
+        self.count = 0
+        self.min_id: Optional[int] = None
+        self.max_id: Optional[int] = None
+        self.offset = 0
+        self.file = None
+
+    async def add(self, record: Dict[str, Any]) -> None:
+        self.pending.append(record)
+        if len(self.pending) >= ARCHIVE_BLOCK_SIZE:
+            await self.flush()
+
+    async def flush(self) -> None:
+        if not self.pending:
+            return
+        records, self.pending = self.pending, []
+        length = await asyncio.to_thread(self._write_block, records)
+        self.blocks.append([records[0]["id"], self.offset, length])
+        self.offset += length
+        self.count += len(records)
+        if self.min_id is None:
+            self.min_id = records[0]["id"]
+        self.max_id = records[-1]["id"]
+
+    async def close(self) -> None:
+        await self.flush()
+        if self.file:
+            await asyncio.to_thread(self.file.close)
+            self.file = None
+
+    def _write_block(self, records: List[Dict[str, Any]]) -> int:
+        if self.file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self.file = open(self.path, "wb")
+        data = gzip.compress("".join(json.dumps(record) + "\n" for record in records).encode("utf-8"))
+        self.file.write(data)
+        return len(data)
+
+def read_archive_block(path: str, offset: int, length: int) -> List[Dict[str, Any]]:
+    with open(path, "rb") as archive:
+        archive.seek(offset)
+        data = gzip.decompress(archive.read(length)).decode("utf-8")
+    return [json.loads(line) for line in data.splitlines() if line.strip()]
+
+def read_archive_record(path: str, blocks: List[List[int]], note_id: int) -> Optional[Dict[str, Any]]:
+    """Find one note by decompressing only the block that can hold it"""
+    index = bisect_right([block[0] for block in blocks], note_id) - 1
+    if index < 0:
+        return None
+    _, offset, length = blocks[index]
+    return next((record for record in read_archive_block(path, offset, length) if record["id"] == note_id), None)
+
+async def iter_archive(path: str, blocks: List[List[int]], skip_ids: Set[int]) -> AsyncIterator[Dict[str, Any]]:
+    """Yield archived notes block by block, leaving out skip_ids"""
+    for _, offset, length in blocks:
+        for record in await asyncio.to_thread(read_archive_block, path, offset, length):
+            if record["id"] not in skip_ids:
+                yield record
+
+async def merge_by_id(
+    archived: AsyncIterator[Dict[str, Any]],
+    live: AsyncIterator[Dict[str, Any]]
+) -> AsyncIterator[Dict[str, Any]]:
+    """Merge two id-sorted note streams; a live row replaces its archived copy"""
+    old = await anext(archived, None)
+    new = await anext(live, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old["id"] < new["id"]):
+            yield old
+            old = await anext(archived, None)
+            continue
+        if old is not None and old["id"] == new["id"]:
+            old = await anext(archived, None)
+        yield new
+        new = await anext(live, None)
+
+def remove_archive(path: str) -> None:
+    if os.path.exists(path):
+        os.remove(path)
+
+def note_to_record(row) -> Dict[str, Any]:
+    return {
+        "id": row["id"],
+        "text": row["text"],
+        "created_at": row["created_at"].isoformat(),
+        "owner_id": row["owner_id"],
+    }
+
+def record_to_note(record: Dict[str, Any]) -> Note:
+    return Note(**{**record, "created_at": datetime.fromisoformat(record["created_at"])})
+
+async def get_dialect_name(session: AsyncSession) -> str:
+    connection = await session.connection()
+    return connection.dialect.name
+
+async def table_exists(session: AsyncSession, name: str) -> bool:
+    result = await session.execute(text("SELECT to_regclass(:name) IS NOT NULL"), {"name": name})
+    return bool(result.scalar())
+
+async def is_note_partitioned(session: AsyncSession) -> bool:
+    """Whether note is a partitioned table (PostgreSQL only)"""
+    result = await session.execute(text(
+        "SELECT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = to_regclass('note'))"
+    ))
+    return bool(result.scalar())
+
+async def create_partition(session: AsyncSession, start: datetime) -> None:
+    """Create a month partition, moving its notes out of the default partition"""
+    name = partition_name(start)
+    if await table_exists(session, name):
+        return
+    end = shift_period(start, 1)
+    await session.execute(text(f"CREATE TABLE {name} (LIKE note)"))
+    await session.execute(
+        text(
+            f"WITH moved AS (DELETE FROM {DEFAULT_PARTITION} "
+            f"WHERE created_at >= :start AND created_at < :end RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ),
+        {"start": start, "end": end},
+    )
+    # Partition bounds cannot be bound parameters; both are generated dates.
+    await session.execute(text(
+        f"ALTER TABLE note ATTACH PARTITION {name} "
+        f"FOR VALUES FROM ('{start:%Y-%m-%d}') TO ('{end:%Y-%m-%d}')"
+    ))
+
+async def ensure_note_partitions(session: AsyncSession, now: Optional[datetime] = None) -> None:
+    """Create the default, current and upcoming monthly note partitions (PostgreSQL only)"""
+    if await get_dialect_name(session) != "postgresql":
+        return
+    # Serialize with other app instances and the beat job doing the same DDL
+    await session.execute(text("SELECT pg_advisory_xact_lock(hashtext('note_partitions'))"))
+    if not await is_note_partitioned(session):
+        print("Table note is not partitioned, skipping note partition maintenance")
+        await session.commit()
+        return
+    await session.execute(text(f"CREATE TABLE IF NOT EXISTS {DEFAULT_PARTITION} PARTITION OF note DEFAULT"))
+    start = period_start(now or datetime.utcnow())
+    for months in range(settings.note_partitions_ahead + 1):
+        await create_partition(session, shift_period(start, months))
+    await session.commit()
+
+async def list_cold_periods(session: AsyncSession, partitioned: bool, cutoff: datetime) -> List[datetime]:
+    """Months before cutoff that may still hold live notes"""
+    if partitioned:
+        result = await session.execute(text(
+            "SELECT child.relname FROM pg_inherits "
+            "JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+            "WHERE pg_inherits.inhparent = to_regclass('note')"
+        ))
+        matches = [PARTITION_NAME.match(name) for name in result.scalars()]
+        periods = {datetime(int(m[1]), int(m[2]), 1) for m in matches if m}
+        if await table_exists(session, DEFAULT_PARTITION):
+            result = await session.execute(
+                text(
+                    f"SELECT DISTINCT date_trunc('month', created_at) FROM {DEFAULT_PARTITION} "
+                    f"WHERE created_at < :cutoff"
+                ),
+                {"cutoff": cutoff},
+            )
+            periods.update(result.scalars())
+        return sorted(start for start in periods if start < cutoff)
+
+    # Without partitions, walk the months from the oldest live note.
+    oldest = (await session.execute(select(func.min(Note.created_at)))).scalar()
+    periods = []
+    start = period_start(oldest) if oldest else cutoff
+    while start < cutoff:
+        periods.append(start)
+        start = shift_period(start, 1)
+    return periods
+
+async def archive_period(session: AsyncSession, dialect: str, partitioned: bool, start: datetime) -> int:
+    """Move one month of notes into an archive file and remove it from the database"""
+    if dialect == "sqlite":
+        # Take the write lock before reading so no note changes until the delete
+        await session.execute(text("BEGIN IMMEDIATE"))
+    end = shift_period(start, 1)
+    in_period = (Note.created_at >= start, Note.created_at < end)
+    period = f"{start:%Y-%m}"
+    name = partition_name(start)
+
+    # Same lock order as restore_archived_note: manifest row first, then notes
+    archive = (await session.execute(
+        select(NoteArchive).where(NoteArchive.period == period)
+        .with_for_update().execution_options(populate_existing=True)
+    )).scalar()
+    has_partition = partitioned and await table_exists(session, name)
+    query = select(Note.id, Note.text, Note.created_at, Note.owner_id).where(*in_period).order_by(Note.id)
+    if has_partition:
+        # Writers wait until the partition is dropped, so no update is lost
+        await session.execute(text(f"LOCK TABLE {name} IN SHARE ROW EXCLUSIVE MODE"))
+    else:
+        query = query.with_for_update()
+
+    live_ids = []
+
+    async def live_records():
+        # Keyset pages instead of a server-side cursor, which would keep the
+        # partition in use and block the DROP below
+        last_id = 0
+        while True:
+            result = await session.execute(query.where(Note.id > last_id).limit(READ_BATCH_SIZE))
+            batch = result.mappings().all()
+            for row in batch:
+                live_ids.append(row["id"])
+                yield note_to_record(row)
+            if len(batch) < READ_BATCH_SIZE:
+                return
+            last_id = batch[-1]["id"]
+
+    live = live_records()
+    first = await anext(live, None)
+    if first is None:
+        if has_partition:
+            await session.execute(text(f"DROP TABLE {name}"))
+        await session.commit()
+        return 0
+
+    async def all_live():
+        yield first
+        async for record in live:
+            yield record
+
+    restored = set()
+    if archive:
+        result = await session.execute(
+            select(NoteArchiveRestored.note_id).where(NoteArchiveRestored.period == period)
+        )
+        restored = set(result.scalars())
+
+    async def old_records():
+        # Restored notes are either live again or deleted; drop their old copy
+        if archive:
+            async for record in iter_archive(archive.path, json.loads(archive.block_index), restored):
+                yield record
+
+    archived_at = datetime.utcnow()
+    writer = ArchiveWriter(archive_path(start, archived_at))
+    try:
+        async for record in merge_by_id(old_records(), all_live()):
+            await writer.add(record)
+        await writer.close()
+
+        if has_partition:
+            await session.execute(text(f"DROP TABLE {name}"))
+        else:
+            for i in range(0, len(live_ids), DELETE_BATCH_SIZE):
+                batch = live_ids[i:i + DELETE_BATCH_SIZE]
+                await session.execute(delete(Note).where(Note.id.in_(batch), *in_period))
+        if restored:
+            await session.execute(delete(NoteArchiveRestored).where(NoteArchiveRestored.period == period))
+        old_path = archive.path if archive else None
+        await session.merge(NoteArchive(
+            period=period,
+            path=writer.path,
+            block_index=json.dumps(writer.blocks),
+            min_id=writer.min_id,
+            max_id=writer.max_id,
+            note_count=writer.count,
+            archived_at=archived_at,
+        ))
+        await session.commit()
+    except Exception:
+        await session.rollback()
+        await writer.close()
+        await asyncio.to_thread(remove_archive, writer.path)
+        raise
+
+    if old_path:
+        await asyncio.to_thread(remove_archive, old_path)
+    return writer.count
+
+async def archive_cold_notes(session: AsyncSession, now: Optional[datetime] = None) -> List[str]:
+    """Archive every month older than settings.note_archive_after_months"""
+    dialect = await get_dialect_name(session)
+    partitioned = dialect == "postgresql" and await is_note_partitioned(session)
+    cutoff = shift_period(period_start(now or datetime.utcnow()), -settings.note_archive_after_months)
+    archived = []
+    for start in await list_cold_periods(session, partitioned, cutoff):
+        if await archive_period(session, dialect, partitioned, start):
+            archived.append(f"{start:%Y-%m}")
+    return archived
+
+async def find_archived_record(session: AsyncSession, note_id: int, lock: bool = False):
+    """Return (archive, record) for an archived note that has not been restored"""
+    result = await session.execute(
+        select(NoteArchive.period).where(NoteArchive.min_id <= note_id, NoteArchive.max_id >= note_id)
+    )
+    for period in result.scalars().all():
+        query = select(NoteArchive).where(NoteArchive.period == period).execution_options(populate_existing=True)
+        if lock:
+            query = query.with_for_update()
+        archive = (await session.execute(query)).scalar()
+        if archive is None:
+            continue
+        if await session.get(NoteArchiveRestored, (period, note_id)):
+            return None, None
+        blocks = json.loads(archive.block_index)
+        record = await asyncio.to_thread(read_archive_record, archive.path, blocks, note_id)
+        if record is not None:
+            return archive, record
+    return None, None
+
+async def read_archived_note(session: AsyncSession, note_id: int, owner_id: int) -> Optional[Note]:
+    """Read-only copy of an archived note, if it exists and belongs to owner_id"""
+    _, record = await find_archived_record(session, note_id)
+    if record is None or record["owner_id"] != owner_id:
+        return None
+    return record_to_note(record)
+
+async def restore_archived_note(session: AsyncSession, note_id: int, owner_id: int) -> Optional[Note]:
+    """Bring one archived note of owner_id back into the note table for a write.
+
+    The note is only added and flushed; the caller's commit makes the restore
+    and its change to the note atomic.
+    """
+    archive, record = await find_archived_record(session, note_id, lock=True)
+    if record is None:
+        # Restored by a concurrent request in the meantime, or never archived
+        return await session.get(Note, note_id)
+    if record["owner_id"] != owner_id:
+        return None
+    note = record_to_note(record)
+    session.add(note)
+    session.add(NoteArchiveRestored(period=archive.period, note_id=note_id))
+    await session.flush()
+    return note
+
+async def run_note_storage_maintenance() -> List[str]:
+    """Entry point for the Celery beat job: add upcoming partitions, archive cold ones"""
+    async with AsyncSessionLocal() as session:
+        await ensure_note_partitions(session)
+        archived = await archive_cold_notes(session)
+    # Each Celery run gets a fresh event loop, so pooled connections can't be reused.
+    await engine.dispose()
+    if archived:
+        # Archived notes must drop out of cached GET /notes lists right away
+        redis_client = redis.from_url(REDIS_URL, decode_responses=True)
+        await CacheManager(redis_client).delete_pattern("notes:*")
+        await redis_client.close()
+    return archived
@@ -8,9 +8,19 @@ from models import User
 from database import get_session
 from auth.dependencies import get_current_user
 from redis_cache import get_cache_manager, CacheManager
+from notes.partitions import read_archived_note, restore_archived_note
 
 router = APIRouter(prefix="/notes", tags=["notes"])
 
+async def get_own_note_for_write(note_id: int, session: AsyncSession, current_user: User) -> Note:
+    note = await session.get(Note, note_id)
+    if not note:
+        # Writing to a cold note brings just that note back from the archive
+        note = await restore_archived_note(session, note_id, current_user.id)
+    if not note or note.owner_id != current_user.id:
+        raise HTTPException(status_code=404, detail="Note not found")
+    return note
+
 @router.post("/", response_model=NoteOut)
 async def create_note(
     note_in: NoteCreate,
@@ -72,6 +82,9 @@ async def read_note(
     current_user: User = Depends(get_current_user)
 ):
     note = await session.get(Note, note_id)
+    if not note:
+        # Cold notes are served read-only from their archive file
+        note = await read_archived_note(session, note_id, current_user.id)
     if not note or note.owner_id != current_user.id:
         raise HTTPException(status_code=404, detail="Note not found")
     return note
@@ -84,9 +97,7 @@ async def update_note(
     current_user: User = Depends(get_current_user),
     cache_manager: CacheManager = Depends(get_cache_manager)
 ):
-    note = await session.get(Note, note_id)
-    if not note or note.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Note not found")
+    note = await get_own_note_for_write(note_id, session, current_user)
     if note_in.text is not None:
         note.text = note_in.text
     await session.commit()
@@ -105,9 +116,7 @@ async def delete_note(
     current_user: User = Depends(get_current_user),
     cache_manager: CacheManager = Depends(get_cache_manager)
 ):
-    note = await session.get(Note, note_id)
-    if not note or note.owner_id != current_user.id:
-        raise HTTPException(status_code=404, detail="Note not found")
+    note = await get_own_note_for_write(note_id, session, current_user)
     await session.delete(note)
     await session.commit()
     
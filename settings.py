@@ -9,6 +9,9 @@ class Settings(BaseSettings):
     celery_result_backend: str = "redis://localhost:6379/0"
     algorithm: str = "HS256"
     access_token_expire_minutes: int = 30
+    note_archive_dir: str = "archive/notes"
+    note_archive_after_months: int = 6
+    note_partitions_ahead: int = 1
 
     class Config:
         env_file = ".env"
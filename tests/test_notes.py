@@ -1,4 +1,14 @@
+import gzip
+import json
+import os
 import pytest
+from datetime import datetime
+from sqlalchemy import update
+from conftest import AsyncSessionTest
+from notes.models import Note, NoteArchive
+from notes import partitions
+from notes.partitions import archive_cold_notes
+from settings import settings
 
 @pytest.mark.asyncio
 def register_and_login(client, username, password):
@@ -52,4 +62,118 @@ async def test_delete_own_and_foreign_note(client):
     # user1 удаляет свою
     resp_ok = client.delete(f"/notes/{note_id}", headers=headers1)
     assert resp_ok.status_code == 200
-    assert resp_ok.json()["ok"] is True 
\ No newline at end of file
+    assert resp_ok.json()["ok"] is True 
+
+@pytest.mark.asyncio
+async def test_archived_note_readable(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "note_archive_dir", str(tmp_path))
+    token1 = register_and_login(client, "archuser1", "archpass1")
+    token2 = register_and_login(client, "archuser2", "archpass2")
+    headers1 = {"Authorization": f"Bearer {token1}"}
+    headers2 = {"Authorization": f"Bearer {token2}"}
+    resp = client.post("/notes/", json={"text": "Old note"}, headers=headers1)
+    note_id = resp.json()["id"]
+    # заметка "стареет" и уходит в архив
+    async with AsyncSessionTest() as session:
+        await session.execute(
+            update(Note).where(Note.id == note_id).values(created_at=datetime(2020, 1, 15))
+        )
+        await session.commit()
+        assert await archive_cold_notes(session) == ["2020-01"]
+    notes = client.get("/notes/", headers=headers1).json()
+    assert all(note["id"] != note_id for note in notes)
+    # чужой пользователь не видит заметку из архива
+    assert client.get(f"/notes/{note_id}", headers=headers2).status_code == 404
+    # владелец читает заметку прямо из архива, в таблицу она не возвращается
+    resp_ok = client.get(f"/notes/{note_id}", headers=headers1)
+    assert resp_ok.status_code == 200
+    assert resp_ok.json()["text"] == "Old note"
+    notes = client.get("/notes/", headers=headers1).json()
+    assert all(note["id"] != note_id for note in notes)
+
+def read_archive_ids(path):
+    with gzip.open(path, "rt") as archive:
+        return [json.loads(line)["id"] for line in archive]
+
+async def archive_note(note_id, created_at):
+    async with AsyncSessionTest() as session:
+        await session.execute(update(Note).where(Note.id == note_id).values(created_at=created_at))
+        await session.commit()
+        return await archive_cold_notes(session)
+
+@pytest.mark.asyncio
+async def test_rearchive_has_no_duplicates(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "note_archive_dir", str(tmp_path))
+    token = register_and_login(client, "rearchuser", "rearchpass")
+    headers = {"Authorization": f"Bearer {token}"}
+    resp = client.post("/notes/", json={"text": "Twice"}, headers=headers)
+    note_id = resp.json()["id"]
+    assert await archive_note(note_id, datetime(2019, 5, 1)) == ["2019-05"]
+    async with AsyncSessionTest() as session:
+        # как после сбоя коммита: строка снова в таблице, а в архиве уже есть
+        session.add(Note(id=note_id, text="Twice", created_at=datetime(2019, 5, 1), owner_id=resp.json()["owner_id"]))
+        await session.commit()
+        assert await archive_cold_notes(session) == ["2019-05"]
+        archive = await session.get(NoteArchive, "2019-05")
+        await session.refresh(archive)
+        assert archive.note_count == 1
+        assert read_archive_ids(archive.path) == [note_id]
+    assert [path.name for path in tmp_path.iterdir()] == [os.path.basename(archive.path)]
+    assert client.get(f"/notes/{note_id}", headers=headers).json()["text"] == "Twice"
+
+@pytest.mark.asyncio
+async def test_update_archived_note(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "note_archive_dir", str(tmp_path))
+    token1 = register_and_login(client, "archupd1", "archpass1")
+    token2 = register_and_login(client, "archupd2", "archpass2")
+    headers1 = {"Authorization": f"Bearer {token1}"}
+    headers2 = {"Authorization": f"Bearer {token2}"}
+    resp = client.post("/notes/", json={"text": "Before"}, headers=headers1)
+    note_id = resp.json()["id"]
+    assert await archive_note(note_id, datetime(2018, 3, 3)) == ["2018-03"]
+    # чужой пользователь не может изменить заметку из архива
+    resp_forbidden = client.put(f"/notes/{note_id}", json={"text": "Hacked"}, headers=headers2)
+    assert resp_forbidden.status_code == 404
+    resp_ok = client.put(f"/notes/{note_id}", json={"text": "After"}, headers=headers1)
+    assert resp_ok.status_code == 200
+    assert resp_ok.json()["text"] == "After"
+    # восстановлена только эта заметка, с прежней датой
+    assert resp_ok.json()["created_at"].startswith("2018-03-03")
+    assert client.get(f"/notes/{note_id}", headers=headers1).json()["text"] == "After"
+    # при повторной архивации в архив попадает новая версия
+    async with AsyncSessionTest() as session:
+        assert await archive_cold_notes(session) == ["2018-03"]
+    assert client.get(f"/notes/{note_id}", headers=headers1).json()["text"] == "After"
+
+@pytest.mark.asyncio
+async def test_delete_archived_note(client, tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "note_archive_dir", str(tmp_path))
+    # несколько страниц чтения и блоков архива даже на паре заметок
+    monkeypatch.setattr(partitions, "READ_BATCH_SIZE", 1)
+    monkeypatch.setattr(partitions, "ARCHIVE_BLOCK_SIZE", 1)
+    token = register_and_login(client, "archdel", "archdelpass")
+    headers = {"Authorization": f"Bearer {token}"}
+    owner_id = client.get("/users/me", headers=headers).json()["id"]
+    note_id = client.post("/notes/", json={"text": "Delete old"}, headers=headers).json()["id"]
+    keep_id = client.post("/notes/", json={"text": "Keep old"}, headers=headers).json()["id"]
+    async with AsyncSessionTest() as session:
+        await session.execute(
+            update(Note).where(Note.id.in_([note_id, keep_id])).values(created_at=datetime(2017, 7, 7))
+        )
+        await session.commit()
+        assert await archive_cold_notes(session) == ["2017-07"]
+    resp = client.delete(f"/notes/{note_id}", headers=headers)
+    assert resp.status_code == 200
+    assert client.get(f"/notes/{note_id}", headers=headers).status_code == 404
+    assert client.delete(f"/notes/{note_id}", headers=headers).status_code == 404
+    assert client.get(f"/notes/{keep_id}", headers=headers).json()["text"] == "Keep old"
+    # удаленная заметка не возвращается и после повторной архивации
+    async with AsyncSessionTest() as session:
+        session.add(Note(text="Late old", created_at=datetime(2017, 7, 8), owner_id=owner_id))
+        await session.commit()
+        assert await archive_cold_notes(session) == ["2017-07"]
+        archive = await session.get(NoteArchive, "2017-07")
+        await session.refresh(archive)
+        assert note_id not in read_archive_ids(archive.path)
+        assert keep_id in read_archive_ids(archive.path)
+    assert client.get(f"/notes/{note_id}", headers=headers).status_code == 404
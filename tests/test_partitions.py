@@ -0,0 +1,133 @@
+import gzip
+import json
+import os
+import pytest
+from datetime import datetime
+from sqlalchemy import text
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.schema import CreateTable
+from sqlmodel import SQLModel
+from models import User
+from notes.models import Note
+from notes.partitions import (
+    ArchiveWriter, period_start, shift_period, partition_name, read_archive_record,
+    ensure_note_partitions, create_partition, list_cold_periods, archive_cold_notes,
+    read_archived_note, restore_archived_note, table_exists
+)
+from settings import settings
+
+PG_DATABASE_URL = os.environ.get("DATABASE_URL", "")
+PG_SCHEMA = "note_partitions_test"
+
+def test_note_ddl_postgresql_partitioned():
+    ddl = str(CreateTable(Note.__table__).compile(dialect=postgresql.dialect()))
+    assert "PRIMARY KEY (id, created_at)" in ddl
+    assert "PARTITION BY RANGE (created_at)" in ddl
+    # остальные таблицы не затронуты
+    user_ddl = str(CreateTable(User.__table__).compile(dialect=postgresql.dialect()))
+    assert "PRIMARY KEY (id)" in user_ddl
+
+def test_note_ddl_sqlite_plain():
+    ddl = str(CreateTable(Note.__table__).compile(dialect=sqlite.dialect()))
+    # удаленные (архивные) id не переиспользуются
+    assert "PRIMARY KEY AUTOINCREMENT" in ddl
+    assert "PARTITION" not in ddl
+
+def test_period_start():
+    assert period_start(datetime(2025, 12, 31, 23, 59, 59, 999999)) == datetime(2025, 12, 1)
+    assert period_start(datetime(2026, 1, 1)) == datetime(2026, 1, 1)
+
+def test_shift_period_year_boundary():
+    assert shift_period(datetime(2025, 12, 1), 1) == datetime(2026, 1, 1)
+    assert shift_period(datetime(2026, 1, 1), -1) == datetime(2025, 12, 1)
+    assert shift_period(datetime(2026, 3, 1), -6) == datetime(2025, 9, 1)
+    assert shift_period(datetime(2025, 11, 1), 14) == datetime(2027, 1, 1)
+    assert shift_period(datetime(2025, 6, 1), 0) == datetime(2025, 6, 1)
+
+def test_partition_name():
+    assert partition_name(datetime(2025, 1, 1)) == "note_y2025m01"
+
+@pytest.mark.asyncio
+async def test_archive_blocks(tmp_path):
+    records = [
+        {"id": i, "text": f"note {i}", "created_at": "2020-01-01T00:00:00", "owner_id": 1}
+        for i in range(1, 1200, 2)
+    ]
+    path = str(tmp_path / "archive.ndjson.gz")
+    writer = ArchiveWriter(path)
+    for record in records:
+        await writer.add(record)
+    await writer.close()
+    blocks = writer.blocks
+    assert len(blocks) > 1
+    assert (writer.count, writer.min_id, writer.max_id) == (len(records), 1, 1199)
+    # файл остается обычным gzip NDJSON
+    with gzip.open(path, "rt") as archive:
+        assert [json.loads(line) for line in archive] == records
+    assert read_archive_record(path, blocks, 1)["text"] == "note 1"
+    assert read_archive_record(path, blocks, 1199)["text"] == "note 1199"
+    assert read_archive_record(path, blocks, 601)["id"] == 601
+    assert read_archive_record(path, blocks, 600) is None
+    assert read_archive_record(path, blocks, 0) is None
+
+async def partition_of(session, note_id):
+    result = await session.execute(text("SELECT tableoid::regclass::text FROM note WHERE id = :id"), {"id": note_id})
+    return result.scalar()
+
+@pytest.mark.skipif(
+    not PG_DATABASE_URL.startswith("postgresql"), reason="needs a PostgreSQL DATABASE_URL"
+)
+@pytest.mark.asyncio
+async def test_postgresql_partition_archival(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "note_archive_dir", str(tmp_path))
+    engine = create_async_engine(
+        PG_DATABASE_URL, connect_args={"server_settings": {"search_path": PG_SCHEMA}}
+    )
+    async with engine.begin() as conn:
+        await conn.execute(text(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE"))
+        await conn.execute(text(f"CREATE SCHEMA {PG_SCHEMA}"))
+        await conn.run_sync(SQLModel.metadata.create_all)
+    try:
+        async with AsyncSession(engine, expire_on_commit=False) as session:
+            await ensure_note_partitions(session, now=datetime(2020, 3, 15))
+            await ensure_note_partitions(session, now=datetime(2020, 3, 15))
+            user = User(username="pguser", password="x")
+            session.add(user)
+            await session.commit()
+            old = Note(text="december", created_at=datetime(2019, 12, 5), owner_id=user.id)
+            jan = Note(text="january", created_at=datetime(2020, 1, 10), owner_id=user.id)
+            mar = Note(text="march", created_at=datetime(2020, 3, 10), owner_id=user.id)
+            session.add_all([old, jan, mar])
+            await session.commit()
+            # заметки вне созданных месяцев попадают в DEFAULT, а не падают
+            assert await partition_of(session, old.id) == "note_default"
+            assert await partition_of(session, jan.id) == "note_default"
+            assert await partition_of(session, mar.id) == "note_y2020m03"
+
+            # новая партиция забирает свои строки из DEFAULT
+            await create_partition(session, datetime(2020, 1, 1))
+            await session.commit()
+            assert await partition_of(session, jan.id) == "note_y2020m01"
+            assert await list_cold_periods(session, True, datetime(2020, 3, 1)) == [
+                datetime(2019, 12, 1), datetime(2020, 1, 1)
+            ]
+
+            assert await archive_cold_notes(session, now=datetime(2020, 9, 1)) == ["2019-12", "2020-01"]
+            assert not await table_exists(session, "note_y2020m01")
+            assert await table_exists(session, "note_y2020m03")
+            assert (await read_archived_note(session, jan.id, user.id)).text == "january"
+            assert await read_archived_note(session, jan.id, user.id + 1) is None
+
+            # запись в архивную заметку возвращает только ее, в DEFAULT
+            session.expunge_all()
+            restored = await restore_archived_note(session, jan.id, user.id)
+            restored.text = "january edited"
+            await session.commit()
+            assert await partition_of(session, jan.id) == "note_default"
+            assert await archive_cold_notes(session, now=datetime(2020, 9, 1)) == ["2020-01"]
+            assert (await read_archived_note(session, jan.id, user.id)).text == "january edited"
+    finally:
+        async with engine.begin() as conn:
+            await conn.execute(text(f"DROP SCHEMA IF EXISTS {PG_SCHEMA} CASCADE"))
+        await engine.dispose()